@@ -0,0 +1,82 @@
+"""
+Database helpers shared by cleanup, monitoring and backups.
+
+Small utilities that keep engine setup in one place.
+"""
+
+import functools
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, URL, make_url
+from sqlalchemy.pool import StaticPool
+
+# Connection-level tuning for SQLite. WAL lets the monitor read while
+# cleanup writes; the rest trades durability-on-power-loss for speed,
+# which is fine for a maintenance tool working on Prefect's own data.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",      # 64 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA busy_timeout=60000",     # wait up to 60s for locks
+)
+
+
+def _is_sqlite(db_url: str) -> bool:
+    """Check if database is SQLite."""
+    return "sqlite" in db_url.lower()
+
+
+def _is_memory_db(url: URL) -> bool:
+    """Check if URL points at an in-memory SQLite database."""
+    database = url.database or ""
+    if database.startswith("file:"):
+        # URI filename (uri=true): file::memory: is the in-memory database
+        database = database[len("file:"):]
+    return database == "" or database.startswith(":memory:") or "mode=memory" in str(url)
+
+
+def _tune_sqlite(engine: Engine) -> None:
+    """Apply performance PRAGMAs to every new SQLite connection."""
+    if not _is_sqlite(str(engine.url)) or _is_memory_db(engine.url):
+        return
+
+    def _apply_pragmas(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    def _optimize(dbapi_conn, _):
+        # Let SQLite refresh statistics it considers stale before closing
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA optimize")
+        cursor.close()
+
+    event.listen(engine, "connect", _apply_pragmas)
+    event.listen(engine, "close", _optimize)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_engine(db_url: str) -> Engine:
+    """
+    Get the shared engine for a database URL.
+    
+    Cleanup, monitoring and backups against the same database reuse one
+    connection pool (and its warm SQLite page cache) instead of each
+    building their own.
+    """
+    url = make_url(db_url)
+    if not _is_sqlite(db_url):
+        return create_engine(url, future=True)
+
+    # The pool is shared across threads, so connections may move between them
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if _is_memory_db(url):
+        # Every connection to :memory: is a new database; keep exactly one
+        kwargs["poolclass"] = StaticPool
+
+    engine = create_engine(url, future=True, **kwargs)
+    _tune_sqlite(engine)
+    return engine
@@ -5,11 +5,13 @@ Simple monitoring that tells you what you need to know.
 """
 
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from prefect.settings import PREFECT_API_DATABASE_CONNECTION_URL
 
+from .database import _get_engine, _is_sqlite
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,15 +30,24 @@ class DatabaseMonitor:
         """Initialize monitor with database connection."""
         self.db_url = database_url or str(PREFECT_API_DATABASE_CONNECTION_URL.value())
         # Force sync engine to avoid async issues
-        self.engine = create_engine(self.db_url, future=True)
+        self.engine = _get_engine(self.db_url)
         
-    def health_check(self) -> Dict[str, Any]:
+    def health_check(self, exact: bool = True) -> Dict[str, Any]:
         """
         Simple health check that tells you everything important.
         
+        Args:
+            exact: Count every row. Pass False for planner estimates
+                (sqlite_stat1 on SQLite, pg_class on PostgreSQL), which need
+                no table scan but are only as fresh as the last ANALYZE, so
+                use them for display only, never to decide on cleanup
+        
         Returns:
             Dict with size, recommendations, and alerts
         """
+        # Local, so concurrent health checks on one monitor don't share it
+        errors = []
+        
         with self.engine.connect() as conn:
             # Get row counts for main tables
             tables = {
@@ -47,15 +58,18 @@ class DatabaseMonitor:
             }
             
             counts = {}
-            for name, table in tables.items():
-                try:
-                    result = conn.execute(text(f"SELECT COUNT(*) FROM {table}"))
-                    counts[name] = result.scalar()
-                except Exception as e:
-                    counts[name] = f"Error: {e}"
+            if not exact and _is_sqlite(self.db_url):
+                counts = self._estimate_counts_sqlite(conn, tables)
+            elif not exact and self.db_url.startswith("postgres"):
+                counts = self._estimate_counts_postgres(conn, tables)
+                
+            missing = {name: table for name, table in tables.items() if name not in counts}
+            if missing:
+                counts.update(self._count_rows(conn, missing, errors))
+            counts = {name: counts[name] for name in tables}
             
             # Calculate total records
-            total_records = sum(v for v in counts.values() if isinstance(v, int))
+            total_records = sum(counts.values())
             
             # Simple recommendations
             needs_cleanup = total_records > 100000  # 100k records
@@ -70,9 +84,66 @@ class DatabaseMonitor:
             "needs_cleanup": needs_cleanup,
             "is_large": is_large,
             "recommendation": recommendation,
+            "errors": errors,
             "status": "healthy" if not needs_cleanup else "attention_needed"
         }
     
+    def _count_rows(self, conn, tables: Dict[str, str], errors: List[str]) -> Dict[str, int]:
+        """Count rows for all tables in one UNION ALL round trip, noting failures in `errors`."""
+        sql = " UNION ALL ".join(
+            f"SELECT '{name}', COUNT(*) FROM {table}"
+            for name, table in tables.items()
+        )
+        try:
+            return {name: count for name, count in conn.execute(text(sql))}
+        except Exception:
+            conn.rollback()
+            
+        # Some table is missing or unreadable: count one by one to find it
+        counts = {}
+        for name, table in tables.items():
+            try:
+                result = conn.execute(text(f"SELECT COUNT(*) FROM {table}"))
+                counts[name] = result.scalar()
+            except Exception as e:
+                conn.rollback()
+                counts[name] = 0
+                errors.append(f"{name}: {e}")
+        return counts
+    
+    def _estimate_counts_sqlite(self, conn, tables: Dict[str, str]) -> Dict[str, int]:
+        """Read row estimates from sqlite_stat1 (populated by ANALYZE)."""
+        names = {table: name for name, table in tables.items()}
+        in_list = ", ".join(f"'{table}'" for table in names)
+        query = text(f"SELECT tbl, stat FROM sqlite_stat1 WHERE tbl IN ({in_list})")
+        try:
+            rows = conn.execute(query).all()
+        except Exception:
+            # No sqlite_stat1 until the database has been analyzed once;
+            # the caller counts instead (the monitor never writes)
+            conn.rollback()
+            return {}
+            
+        # The first number of every stat row is the table's row count
+        return {names[tbl]: int(stat.split()[0]) for tbl, stat in rows}
+    
+    def _estimate_counts_postgres(self, conn, tables: Dict[str, str]) -> Dict[str, int]:
+        """Read row estimates from pg_class (kept current by (auto)ANALYZE)."""
+        names = {table: name for name, table in tables.items()}
+        in_list = ", ".join(f"'{table}'" for table in names)
+        try:
+            rows = conn.execute(text(
+                "SELECT c.relname, c.reltuples::bigint FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                f"WHERE n.nspname = 'public' AND c.relname IN ({in_list})"
+            )).all()
+        except Exception:
+            conn.rollback()
+            return {}
+            
+        # reltuples is -1 for tables that were never analyzed
+        return {names[relname]: tuples for relname, tuples in rows if tuples >= 0}
+    
     def _get_recommendation(self, total_records: int) -> str:
         """Get simple, actionable recommendation."""
         if total_records < 10000:
@@ -87,8 +158,8 @@ class DatabaseMonitor:
             return "URGENT: Database is very large, cleanup immediately"
     
     def size_summary(self) -> str:
-        """Get a human-readable size summary."""
-        health = self.health_check()
+        """Get a human-readable size summary (from row estimates)."""
+        health = self.health_check(exact=False)
         total = health["total_records"]
         status = health["status"]
         rec = health["recommendation"]
@@ -99,5 +170,5 @@ Total Records: {total:,}
 Recommendation: {rec}
 
 Table Breakdown:
-{chr(10).join(f"  {name}: {count:,}" if isinstance(count, int) else f"  {name}: {count}" for name, count in health["table_counts"].items())}
+{chr(10).join(f"  {name}: {count:,}" for name, count in health["table_counts"].items())}
         """.strip()
\ No newline at end of file
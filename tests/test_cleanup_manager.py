@@ -5,113 +5,208 @@ Simple tests that prove our code works.
 """
 
 import pytest
-import tempfile
 import sqlite3
-import time
-from datetime import datetime, timedelta
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from sqlalchemy import text
+
 from prefect_cleanup import PrefectCleanup, DatabaseMonitor
+from prefect_cleanup.cleanup_manager import _DELETE_STMTS, _TABLES as _CLEANUP_TABLES
+
+
+# All tables that cleanup expects (simplified Prefect schema)
+_TABLES_SQL = (
+    """CREATE TABLE log (
+        id INTEGER PRIMARY KEY,
+        created TIMESTAMP,
+        message TEXT
+    )""",
+    """CREATE TABLE flow_run (
+        id INTEGER PRIMARY KEY,
+        created TIMESTAMP,
+        name TEXT
+    )""",
+    """CREATE TABLE task_run (
+        id INTEGER PRIMARY KEY,
+        created TIMESTAMP,
+        name TEXT
+    )""",
+    """CREATE TABLE task_run_state (
+        id INTEGER PRIMARY KEY,
+        created TIMESTAMP,
+        state_type TEXT
+    )""",
+    """CREATE TABLE flow_run_state (
+        id INTEGER PRIMARY KEY,
+        created TIMESTAMP,
+        state_type TEXT
+    )""",
+    """CREATE TABLE events (
+        id INTEGER PRIMARY KEY,
+        created TIMESTAMP,
+        event_type TEXT
+    )""",
+    """CREATE TABLE event_resources (
+        id INTEGER PRIMARY KEY,
+        created TIMESTAMP,
+        resource_id TEXT
+    )""",
+    """CREATE TABLE artifact (
+        id INTEGER PRIMARY KEY,
+        created TIMESTAMP,
+        artifact_type TEXT
+    )""",
+    # Cleanup deletes by `created`; index it like a production schema
+    *(
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_created ON {table}(created)"
+        for table in _CLEANUP_TABLES
+    ),
+)
+
+# Seed timestamps as text in the format Prefect stores on SQLite (naive UTC),
+# rather than datetime objects, which go through sqlite3's deprecated
+# default adapter on every bind
+_NOW = datetime.now(timezone.utc).replace(tzinfo=None)
+_OLD_TS = (_NOW - timedelta(days=60)).isoformat(sep=" ", timespec="microseconds")
+_NEW_TS = (_NOW - timedelta(days=10)).isoformat(sep=" ", timespec="microseconds")
+# What cleanup computes for days=30, for tests that call its helpers directly
+_CUTOFF_TS = (_NOW - timedelta(days=30)).isoformat(sep=" ", timespec="microseconds")
+
+# Some old data (should be cleaned), some new (should be kept)
+_SEED_SQL = (
+    "INSERT INTO log (created, message) VALUES "
+    f"('{_OLD_TS}', 'Old log entry'), ('{_NEW_TS}', 'New log entry')",
+    "INSERT INTO flow_run (created, name) VALUES "
+    f"('{_OLD_TS}', 'Old flow run'), ('{_NEW_TS}', 'New flow run')",
+)
+
+# Schema and seed rows in one script: one call, one transaction
+_SETUP_SQL = "BEGIN IMMEDIATE;\n" + ";\n".join(_TABLES_SQL + _SEED_SQL) + ";\nCOMMIT;"
+
+
+def _create_test_data(db_path):
+    """Create test database with sample data."""
+    # Autocommit mode: the script's own BEGIN/COMMIT is the only transaction
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # Throwaway database: skip the journal file and fsyncs
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
+    
+    conn.executescript(_SETUP_SQL)
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def template_db():
+    """
+    Seeded database built once per session; test databases clone it.
+    
+    Lives in a private temporary directory that is removed as a whole at
+    session end. Under pytest-xdist every worker process gets its own
+    directory, so workers build private templates without any locking.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "_template.db"
+        _create_test_data(path)
+        yield path
+
+
+@pytest.fixture(scope="session")
+def template_conn(template_db):
+    """
+    Read-only connection to the template, open for the whole session.
+    
+    Every clone copies from it, so the template's pages are read through
+    one warm page cache instead of reopening the file for each test.
+    """
+    conn = sqlite3.connect(f"{template_db.as_uri()}?mode=ro", uri=True)
+    yield conn
+    conn.close()
+
+
+def _clone_template(template_conn):
+    """
+    Copy the template into a fresh shared-cache in-memory database.
+    
+    Returns the SQLAlchemy URL and the connection keeping the database alive.
+    """
+    # No files, no fsync, no waiting for Windows to release file handles
+    db_uri = f"file:test_{uuid.uuid4().hex}?mode=memory&cache=shared"
+    conn = sqlite3.connect(db_uri, uri=True)
+    
+    # Page-level copy of the template instead of re-running DDL and inserts
+    template_conn.backup(conn)
+    
+    # Only the library touches the data; this connection just keeps the
+    # database alive, so make any write through it fail loudly
+    conn.execute("PRAGMA query_only=1")
+    
+    return f"sqlite:///{db_uri}&uri=true", conn
+
+
+def _add_rows(db_url, table, created, count):
+    """Insert `count` bare rows with the given timestamp through the library's engine."""
+    with PrefectCleanup(database_url=db_url).engine.begin() as conn:
+        conn.execute(
+            text(f"INSERT INTO {table} (created) VALUES (:created)"),
+            [{"created": created}] * count
+        )
+
+
+def _release(db_url, conn):
+    """Drop a cloned database once nothing needs it."""
+    conn.close()
+    # Release the pooled connection the library's shared engine holds
+    PrefectCleanup(database_url=db_url).engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def seeded_db(template_conn):
+    """One seeded database shared by the tests that only read it."""
+    db_url, conn = _clone_template(template_conn)
+    yield db_url
+    _release(db_url, conn)
+
+
+@pytest.fixture
+def file_db(template_conn, tmp_path):
+    """Private seeded database file, for the code paths that skip :memory:."""
+    path = tmp_path / "prefect.db"
+    conn = sqlite3.connect(path)
+    template_conn.backup(conn)
+    conn.close()
+    
+    db_url = f"sqlite:///{path}"
+    yield db_url
+    PrefectCleanup(database_url=db_url).engine.dispose()
+
+
+@pytest.fixture(params=["memory", "file"])
+def mutable_db(request, template_conn):
+    """
+    Private seeded database for a test that modifies it.
+    
+    Runs in memory and on a real file: connection tuning, WAL checkpoints
+    and VACUUM only happen for file databases.
+    """
+    if request.param == "file":
+        yield request.getfixturevalue("file_db")
+        return
+        
+    db_url, conn = _clone_template(template_conn)
+    yield db_url
+    _release(db_url, conn)
 
 
 class TestPrefectCleanup:
     """Test the main cleanup functionality."""
     
-    def setup_method(self):
-        """Create a test database for each test."""
-        # Create temporary database
-        self.db_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
-        self.db_file.close()  # Close file handle to avoid Windows permission issues
-        self.db_url = f"sqlite:///{self.db_file.name}"
-        
-        # Create test tables and data
-        self._create_test_data()
-        
-    def teardown_method(self):
-        """Clean up after each test."""
-        # Give a moment for connections to close
-        time.sleep(0.1)
-        try:
-            Path(self.db_file.name).unlink(missing_ok=True)
-        except PermissionError:
-            # On Windows, sometimes the file is still locked
-            pass
-        
-    def _create_test_data(self):
-        """Create test database with sample data."""
-        conn = sqlite3.connect(self.db_file.name)
-        cursor = conn.cursor()
-        
-        # Create all tables that cleanup expects (simplified Prefect schema)
-        tables_to_create = [
-            """CREATE TABLE log (
-                id INTEGER PRIMARY KEY,
-                created TIMESTAMP,
-                message TEXT
-            )""",
-            """CREATE TABLE flow_run (
-                id INTEGER PRIMARY KEY,
-                created TIMESTAMP,
-                name TEXT
-            )""",
-            """CREATE TABLE task_run (
-                id INTEGER PRIMARY KEY,
-                created TIMESTAMP,
-                name TEXT
-            )""",
-            """CREATE TABLE task_run_state (
-                id INTEGER PRIMARY KEY,
-                created TIMESTAMP,
-                state_type TEXT
-            )""",
-            """CREATE TABLE flow_run_state (
-                id INTEGER PRIMARY KEY,
-                created TIMESTAMP,
-                state_type TEXT
-            )""",
-            """CREATE TABLE events (
-                id INTEGER PRIMARY KEY,
-                created TIMESTAMP,
-                event_type TEXT
-            )""",
-            """CREATE TABLE event_resources (
-                id INTEGER PRIMARY KEY,
-                created TIMESTAMP,
-                resource_id TEXT
-            )""",
-            """CREATE TABLE artifact (
-                id INTEGER PRIMARY KEY,
-                created TIMESTAMP,
-                artifact_type TEXT
-            )"""
-        ]
-        
-        # Create all tables
-        for table_sql in tables_to_create:
-            cursor.execute(table_sql)
-        
-        # Add test data - some old, some new
-        old_date = datetime.now() - timedelta(days=60)
-        new_date = datetime.now() - timedelta(days=10)
-        
-        # Old data (should be cleaned)
-        cursor.execute("INSERT INTO log (created, message) VALUES (?, ?)", 
-                      (old_date, "Old log entry"))
-        cursor.execute("INSERT INTO flow_run (created, name) VALUES (?, ?)", 
-                      (old_date, "Old flow run"))
-        
-        # New data (should be kept)
-        cursor.execute("INSERT INTO log (created, message) VALUES (?, ?)", 
-                      (new_date, "New log entry"))
-        cursor.execute("INSERT INTO flow_run (created, name) VALUES (?, ?)", 
-                      (new_date, "New flow run"))
-        
-        conn.commit()
-        conn.close()
-        
-    def test_cleanup_removes_old_data(self):
+    def test_cleanup_removes_old_data(self, mutable_db):
         """Test that cleanup removes old data but keeps recent data."""
-        cleanup = PrefectCleanup(database_url=self.db_url)
+        cleanup = PrefectCleanup(database_url=mutable_db)
         
         # Run cleanup (keep last 30 days)
         stats = cleanup.run(days=30)
@@ -120,24 +215,118 @@ class TestPrefectCleanup:
         assert stats.get('log', 0) >= 1, "Should remove old log entries"
         assert stats.get('flow_run', 0) >= 1, "Should remove old flow runs"
         
-        # Verify new data still exists
-        conn = sqlite3.connect(self.db_file.name)
-        cursor = conn.cursor()
+        # Verify new data still exists, through the same pooled connection
+        counts = DatabaseMonitor(database_url=mutable_db).health_check(exact=True)["table_counts"]
+        remaining_logs, remaining_flows = counts["logs"], counts["flow_runs"]
+        
+        assert remaining_logs >= 1, "Should keep recent log entries"
+        assert remaining_flows >= 1, "Should keep recent flow runs"
+        
+    def test_chunked_delete_spans_batches(self, file_db):
+        """Test that batched deletes keep going until every old row is gone."""
+        # 5 old rows in batches of 2: two full batches and a partial one
+        _add_rows(file_db, "flow_run", _OLD_TS, 4)
+        cleanup = PrefectCleanup(database_url=file_db)
         
-        cursor.execute("SELECT COUNT(*) FROM log")
-        remaining_logs = cursor.fetchone()[0]
+        with cleanup.engine.connect() as conn:
+            deleted = cleanup._chunked_delete(conn, "flow_run", _CUTOFF_TS, chunk=2)
+            survivors = conn.exec_driver_sql("SELECT name FROM flow_run").all()
+            
+        assert deleted == 5
+        assert survivors == [("New flow run",)]
         
-        cursor.execute("SELECT COUNT(*) FROM flow_run") 
-        remaining_flows = cursor.fetchone()[0]
+    def test_rebuild_log_keeps_survivors(self, file_db):
+        """Test that rebuilding a mostly-old `log` keeps exactly the recent rows."""
+        # 21 old rows against 1 recent: under the rebuild ratio
+        _add_rows(file_db, "log", _OLD_TS, 20)
+        cleanup = PrefectCleanup(database_url=file_db)
         
-        conn.close()
+        with cleanup.engine.connect() as conn:
+            deleted = cleanup._rebuild_log(conn, _CUTOFF_TS)
+            survivors = conn.exec_driver_sql("SELECT message FROM log").all()
+            
+        assert deleted == 21
+        assert survivors == [("New log entry",)]
         
-        assert remaining_logs >= 1, "Should keep recent log entries"
-        assert remaining_flows >= 1, "Should keep recent flow runs"
+    def test_cleanup_vacuum_shrinks_file(self, file_db):
+        """Test that vacuuming after cleanup gives freed pages back to the filesystem."""
+        # Enough old rows to fill pages that cleanup then frees
+        _add_rows(file_db, "log", _OLD_TS, 5_000)
+        cleanup = PrefectCleanup(database_url=file_db)
+        
+        cleanup.run(days=30)
+        
+        assert cleanup.bytes_reclaimed > 0
+        with cleanup.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+            # The vacuum connection went back to the pool with its settings
+            assert conn.exec_driver_sql("PRAGMA temp_store").scalar() == 2
+            
+    def test_cleanup_uri_file_url(self, file_db):
+        """Test that cleanup (and its vacuum) works on a `file:...?uri=true` URL."""
+        path = file_db[len("sqlite:///"):]
+        db_url = f"sqlite:///file:{path}?uri=true"
+        _add_rows(db_url, "log", _OLD_TS, 5_000)
+        cleanup = PrefectCleanup(database_url=db_url)
+        
+        try:
+            stats = cleanup.run(days=30)
+        finally:
+            cleanup.engine.dispose()
+            
+        assert stats["log"] == 5_001
+        assert cleanup.bytes_reclaimed > 0
         
-    def test_database_monitor(self):
+    def test_cleanup_uri_memory_url(self):
+        """Test that cleanup on `file::memory:` runs without trying to vacuum a file."""
+        cleanup = PrefectCleanup(database_url="sqlite:///file::memory:?cache=shared&uri=true")
+        try:
+            with cleanup.engine.begin() as conn:
+                for statement in _TABLES_SQL:
+                    conn.exec_driver_sql(statement)
+            _add_rows(cleanup.db_url, "log", _OLD_TS, 3)
+            
+            stats = cleanup.run(days=30)
+            
+            assert stats["log"] == 3
+            assert cleanup._vacuum() == 0
+        finally:
+            cleanup.engine.dispose()
+            
+    def test_cleanup_restores_connection_pragmas(self, file_db):
+        """Test that cleanup's session PRAGMAs don't leak into the shared pool."""
+        cleanup = PrefectCleanup(database_url=file_db)
+        pragmas = "SELECT * FROM pragma_cache_spill, pragma_secure_delete, pragma_journal_size_limit"
+        with cleanup.engine.connect() as conn:
+            before = conn.exec_driver_sql(pragmas).one()
+            
+        cleanup.run(days=30, vacuum=False)
+        
+        with cleanup.engine.connect() as conn:
+            assert conn.exec_driver_sql(pragmas).one() == before
+            
+    def test_indexes_ensured_once_per_database(self, file_db, monkeypatch):
+        """Test that a new PrefectCleanup (as quick_cleanup makes) skips index setup."""
+        PrefectCleanup(database_url=file_db).run(days=30, vacuum=False)
+        calls = []
+        monkeypatch.setattr(PrefectCleanup, "_ensure_indexes", lambda self: calls.append(self))
+        
+        PrefectCleanup(database_url=file_db).run(days=30, vacuum=False)
+        
+        assert calls == []
+        
+    def test_cleanup_delete_uses_created_index(self, template_conn):
+        """Test that the cleanup DELETE seeks the created index, not a full scan."""
+        plan = template_conn.execute(
+            f"EXPLAIN QUERY PLAN {_DELETE_STMTS['rowid']['log']}",
+            {"cutoff": "2000-01-01", "chunk": 10_000}
+        ).fetchall()
+        
+        assert any("idx_log_created" in row[-1] for row in plan), plan
+        
+    def test_database_monitor(self, seeded_db):
         """Test database monitoring functionality."""
-        monitor = DatabaseMonitor(database_url=self.db_url)
+        monitor = DatabaseMonitor(database_url=seeded_db)
         
         health = monitor.health_check()
         
@@ -151,9 +340,28 @@ class TestPrefectCleanup:
         # Should detect our test data
         assert health['total_records'] > 0
         
-    def test_size_summary(self):
+    def test_database_monitor_estimates(self, file_db):
+        """Test that estimates are opt-in, never written, and don't drive health."""
+        monitor = DatabaseMonitor(database_url=file_db)
+        
+        # No statistics yet: fall back to counting instead of running ANALYZE
+        estimated = monitor.health_check(exact=False)
+        assert estimated['table_counts']['logs'] == 2
+        with monitor.engine.connect() as conn:
+            assert conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).scalar() is None
+            
+        # Cleanup analyzes what it deleted from; later inserts make that stale
+        PrefectCleanup(database_url=file_db).run(days=30)
+        _add_rows(file_db, "log", _NEW_TS, 5)
+        
+        assert monitor.health_check(exact=False)['table_counts']['logs'] == 1
+        assert monitor.health_check()['table_counts']['logs'] == 6
+        
+    def test_size_summary(self, seeded_db):
         """Test human-readable size summary."""
-        monitor = DatabaseMonitor(database_url=self.db_url)
+        monitor = DatabaseMonitor(database_url=seeded_db)
         
         summary = monitor.size_summary()
         
@@ -165,24 +373,6 @@ class TestPrefectCleanup:
 
 # Simple test runner
 if __name__ == "__main__":
-    # Run tests manually if pytest isn't available
-    test = TestPrefectCleanup()
-    
-    print("Running tests...")
-    
-    test.setup_method()
-    test.test_cleanup_removes_old_data()
-    test.teardown_method()
-    print("Cleanup test passed")
-    
-    test.setup_method()
-    test.test_database_monitor()
-    test.teardown_method()
-    print("Monitor test passed")
-    
-    test.setup_method()
-    test.test_size_summary()
-    test.teardown_method()
-    print("Summary test passed")
-    
-    print("All tests passed!")
\ No newline at end of file
+    # Fixtures need pytest; run this file through it
+    import sys
+    sys.exit(pytest.main([__file__, "-x"]))
@@ -0,0 +1,42 @@
+"""
+Tests for the shared database helpers
+
+Simple tests that prove engine setup recognises every SQLite URL form.
+"""
+
+import pytest
+from sqlalchemy.engine import make_url
+
+from prefect_cleanup.database import _is_memory_db
+
+
+class TestIsMemoryDb:
+    """Test in-memory SQLite URL detection."""
+    
+    @pytest.mark.parametrize("db_url", [
+        "sqlite://",
+        "sqlite:///:memory:",
+        "sqlite:///:memory:?cache=shared",
+        "sqlite:///file::memory:?uri=true",
+        "sqlite:///file::memory:?cache=shared&uri=true",
+        "sqlite:///file:test?mode=memory&cache=shared&uri=true",
+    ])
+    def test_memory_urls(self, db_url):
+        """Test that every in-memory URL form is recognised."""
+        assert _is_memory_db(make_url(db_url))
+        
+    @pytest.mark.parametrize("db_url", [
+        "sqlite:///prefect.db",
+        "sqlite:////tmp/prefect.db",
+        "sqlite:///file:/tmp/prefect.db?uri=true",
+    ])
+    def test_file_urls(self, db_url):
+        """Test that file databases are not mistaken for in-memory ones."""
+        assert not _is_memory_db(make_url(db_url))
+
+
+# Simple test runner
+if __name__ == "__main__":
+    # Fixtures need pytest; run this file through it
+    import sys
+    sys.exit(pytest.main([__file__, "-x"]))